@@ -3,23 +3,30 @@ import json
 import time
 import base64
 import os
+import hashlib
 import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from functools import lru_cache
 from typing import Optional, List
 
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, Response, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi import UploadFile, File, Form
+from starlette.concurrency import run_in_threadpool
 
 # Initialize app and static files
 app = FastAPI()
-STATIC_ROOT = os.path.join(os.path.dirname(__file__), 'static')
+# BRIDGE_STATIC_ROOT lets test runs (loadtest.py) use a scratch directory
+STATIC_ROOT = os.environ.get('BRIDGE_STATIC_ROOT') or os.path.join(os.path.dirname(__file__), 'static')
 try:
     os.makedirs(STATIC_ROOT, exist_ok=True)
 except Exception:
     pass
-app.mount('/files', StaticFiles(directory=STATIC_ROOT), name='files')
 
 # Allow CORS for local dev
 app.add_middleware(
@@ -60,6 +67,112 @@ current_settings = {
 }
 preview_on = False
 
+# --- Camera command queue ---
+# All camera state changes (mode, settings, brackets) run on one consumer task in arrival order,
+# so a bracket is never interleaved with other commands. Settings updates are held for a short
+# merge window, so a slider burst becomes one camera round trip; every caller gets the merged result.
+CAMERA_SETTINGS_MERGE_WINDOW = 0.04  # wait this long after the latest settings update for another
+CAMERA_SETTINGS_MERGE_MAX = 0.25     # but never hold the first update of a burst longer than this
+
+class CameraCommand:
+    __slots__ = ("kind", "payload", "future", "enqueued")
+
+    def __init__(self, kind: str, payload, future: asyncio.Future):
+        self.kind = kind
+        self.payload = payload
+        self.future = future
+        self.enqueued = time.monotonic()
+
+class CameraCommandQueue:
+    def __init__(self):
+        self._pending = deque()
+        self._wake: Optional[asyncio.Event] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._loop = None
+        self.stats = {"processed": 0, "executed": 0, "coalesced": 0, "waitMsAvg": 0.0, "waitMsMax": 0.0}
+
+    def _ensure_worker(self):
+        loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done() or self._loop is not loop:
+            self._loop = loop
+            self._wake = asyncio.Event()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, kind: str, payload=None) -> dict:
+        self._ensure_worker()
+        future = self._loop.create_future()
+        self._pending.append(CameraCommand(kind, payload, future))
+        self._wake.set()
+        return await future
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "depth": len(self._pending)}
+
+    async def _run(self):
+        while True:
+            if not self._pending:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            batch = [self._pending.popleft()]
+            payload = batch[0].payload
+            if batch[0].kind == "settings":
+                payload = dict(payload)
+                deadline = batch[0].enqueued + CAMERA_SETTINGS_MERGE_MAX
+                while True:
+                    while self._pending and self._pending[0].kind == "settings":
+                        cmd = self._pending.popleft()
+                        payload.update(cmd.payload)
+                        batch.append(cmd)
+                    if self._pending:
+                        break  # another command kind is next: keep arrival order
+                    timeout = min(batch[-1].enqueued + CAMERA_SETTINGS_MERGE_WINDOW, deadline) - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    self._wake.clear()
+                    try:
+                        await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        break
+
+            started = time.monotonic()
+            for cmd in batch:
+                wait_ms = (started - cmd.enqueued) * 1000.0
+                self.stats["processed"] += 1
+                self.stats["waitMsAvg"] += (wait_ms - self.stats["waitMsAvg"]) / self.stats["processed"]
+                self.stats["waitMsMax"] = max(self.stats["waitMsMax"], wait_ms)
+            self.stats["executed"] += 1
+            self.stats["coalesced"] += len(batch) - 1
+
+            try:
+                result = await _execute_camera_command(batch[0].kind, payload)
+            except Exception as e:
+                for cmd in batch:
+                    if not cmd.future.done():
+                        cmd.future.set_exception(e)
+                continue
+            for cmd in batch:
+                if not cmd.future.done():
+                    cmd.future.set_result({**result, "queue": {
+                        "waitMs": round((started - cmd.enqueued) * 1000.0, 1),
+                        "coalesced": len(batch),
+                    }})
+
+camera_queue = CameraCommandQueue()
+
+async def _execute_camera_command(kind: str, payload) -> dict:
+    # Runs on the queue consumer only; the sole writer of current_mode/current_settings
+    global current_mode
+    if kind == "settings":
+        current_settings.update(payload)
+        return {"ok": True, "settings": dict(current_settings)}
+    if kind == "mode":
+        current_mode = payload
+        return {"ok": True, "mode": current_mode}
+    if kind == "bracket":
+        return await _run_bracket(payload)
+    raise ValueError(f"Unknown camera command: {kind}")
+
 @app.get("/info")
 async def info(request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
@@ -72,9 +185,8 @@ async def set_mode(request: Request, token: Optional[str] = None):
         raise HTTPException(status_code=401, detail="Unauthorized")
     body = await request.json()
     mode = body.get("mode")
-    global current_mode
     if mode in ["video", "photo", "timelapse"]:
-        current_mode = mode
+        return await camera_queue.submit("mode", mode)
     return {"ok": True, "mode": current_mode}
 
 from pydantic import BaseModel
@@ -95,10 +207,14 @@ class Settings(BaseModel):
 async def set_settings(payload: Settings, request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
-    global current_settings
     incoming = payload.dict(exclude_unset=True)
-    current_settings.update(incoming)
-    return {"ok": True, "settings": current_settings}
+    return await camera_queue.submit("settings", incoming)
+
+@app.get("/camera/queue")
+async def camera_queue_stats(request: Request, token: Optional[str] = None):
+    if not _is_authorized(request, token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return {"ok": True, **camera_queue.snapshot()}
 
 @app.post("/record/start")
 async def record_start(request: Request, token: Optional[str] = None):
@@ -135,22 +251,36 @@ async def preview_stop(request: Request, token: Optional[str] = None):
     return {"ok": True, "preview_on": preview_on}
 
 # Fake preview frame generator
-from PIL import Image, ImageDraw
+from PIL import Image, ImageDraw, UnidentifiedImageError
 from io import BytesIO
 
-def generate_preview_frame(ev: float = 0.0) -> bytes:
-    img = Image.new('RGB', (640, 360), color=(20, 20, 20))
+PREVIEW_SIZE = (640, 360)
+
+@lru_cache(maxsize=4)
+def _render_preview_image(t: int, ev: float) -> Image.Image:
+    img = Image.new('RGB', PREVIEW_SIZE, color=(20, 20, 20))
     draw = ImageDraw.Draw(img)
-    t = int(time.time())
     x = (t * 50) % 600 + 20
     y = ((t * 30) % 300) + 30
     draw.ellipse((x-10, y-10, x+10, y+10), fill=(255, 64, 64))
     draw.text((20, 20), f"Preview {t}", fill=(200, 200, 200))
     draw.text((20, 40), f"EV {ev:+.1f}", fill=(200, 200, 200))
+    return img
+
+@lru_cache(maxsize=32)
+def _encode_preview(t: int, ev: float, width: int, height: int, quality: int) -> bytes:
+    # The mock frame only changes once per second, so all clients share encodes per (size, quality)
+    img = _render_preview_image(t, ev)
+    if (width, height) != img.size:
+        img = img.resize((width, height), Image.BILINEAR)
     buf = BytesIO()
-    img.save(buf, format='JPEG', quality=60)
+    img.save(buf, format='JPEG', quality=quality)
     return buf.getvalue()
 
+def generate_preview_frame(ev: float = 0.0, size: Optional[tuple] = None, quality: int = 60) -> bytes:
+    width, height = size or PREVIEW_SIZE
+    return _encode_preview(int(time.time()), float(ev), width, height, quality)
+
 @app.get("/preview/frame")
 async def preview_frame(request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
@@ -187,6 +317,15 @@ async def preview_mjpeg(request: Request, token: Optional[str] = None):
     })
 
 # --- Events (SSE + Long Poll) ---
+def _status_state() -> dict:
+    return {
+        "ok": True,
+        "timestamp": int(time.time()),
+        "preview_on": preview_on,
+        "mode": current_mode,
+        "settings": current_settings,
+    }
+
 @app.get("/events")
 async def events(request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
@@ -196,13 +335,7 @@ async def events(request: Request, token: Optional[str] = None):
         while True:
             if await request.is_disconnected():
                 break
-            state = {
-                "ok": True,
-                "timestamp": int(time.time()),
-                "preview_on": preview_on,
-                "mode": current_mode,
-                "settings": current_settings,
-            }
+            state = _status_state()
             # Advise client to retry quickly and tag messages
             yield "retry: 2000\n"
             yield f"id: {state['timestamp']}\n"
@@ -225,19 +358,397 @@ async def preview_stream(request: Request, token: Optional[str] = None):
 async def events_poll(request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
-    state = {
-        "ok": True,
-        "timestamp": int(time.time()),
-        "preview_on": preview_on,
-        "mode": current_mode,
-        "settings": current_settings,
-    }
+    state = _status_state()
     return JSONResponse(content=state, headers={
         "Cache-Control": "no-cache, no-store, must-revalidate",
         "Pragma": "no-cache",
         "Expires": "0",
     })
 
+# --- WebSocket preview (binary JPEG frames + JSON status) ---
+# Client -> server (text JSON):
+#   {"type": "config", "width": 640, "height": 360, "quality": 60, "fps": 5, "adaptive": true}
+#   {"type": "ack"} after each binary frame has been handled (recommended)
+# Server -> client: binary messages are JPEG frames; text messages are JSON
+#   {"type": "config", ...effective settings}, {"type": "status", ...same as /events}, {"type": "stats", ...}
+# Frames are rendered when due and never queued: with acks at most PREVIEW_WS_WINDOW frames are
+# in flight and frames due meanwhile are dropped (latest frame wins). The backlog is the
+# send-to-ack delay (send duration for clients without acks). With "adaptive", quality and then
+# scale step down while it exceeds half the frame interval and recover once the link keeps up.
+PREVIEW_WS_MAX_SIZE = (1920, 1080)
+PREVIEW_WS_QUALITY_RANGE = (25, 90)
+PREVIEW_WS_FPS_RANGE = (1, 30)
+PREVIEW_WS_WINDOW = 2
+PREVIEW_WS_ACK_TIMEOUT = 2.0       # unacked this long (or 4 frame intervals, if longer) -> frame counts as lost
+PREVIEW_WS_ACK_TIMEOUT_FRAMES = 4
+PREVIEW_WS_TRACKED = 64            # frames remembered before a client starts acking
+
+def _clamp(value, lo, hi):
+    return max(lo, min(hi, value))
+
+def _preview_ws_config(current: dict, msg: dict) -> dict:
+    cfg = dict(current)
+    try:
+        if "width" in msg:
+            cfg["width"] = int(_clamp(int(msg["width"]), 16, PREVIEW_WS_MAX_SIZE[0]))
+        if "height" in msg:
+            cfg["height"] = int(_clamp(int(msg["height"]), 16, PREVIEW_WS_MAX_SIZE[1]))
+        if "quality" in msg:
+            cfg["quality"] = int(_clamp(int(msg["quality"]), *PREVIEW_WS_QUALITY_RANGE))
+        if "fps" in msg:
+            cfg["fps"] = float(_clamp(float(msg["fps"]), *PREVIEW_WS_FPS_RANGE))
+        if "adaptive" in msg:
+            cfg["adaptive"] = bool(msg["adaptive"])
+    except (TypeError, ValueError, OverflowError):
+        pass
+    return cfg
+
+@app.websocket("/preview/ws")
+async def preview_ws(websocket: WebSocket, token: Optional[str] = None):
+    if not _is_authorized(websocket, token):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+
+    loop = asyncio.get_running_loop()
+    cfg = {"width": PREVIEW_SIZE[0], "height": PREVIEW_SIZE[1], "quality": 60, "fps": 5.0, "adaptive": True}
+    link = {"config": True, "acks": False, "backlog": 0.0}
+    in_flight = OrderedDict()  # seq -> send time of frames not yet acked, oldest first
+    wake = asyncio.Event()
+    closed = asyncio.Event()
+
+    async def receive_loop():
+        try:
+            while True:
+                try:
+                    msg = json.loads(await websocket.receive_text())
+                except ValueError:
+                    continue
+                if not isinstance(msg, dict):
+                    continue
+                kind = msg.get("type", "config")
+                if kind == "ack":
+                    seq = msg.get("seq")
+                    if not isinstance(seq, int) or isinstance(seq, bool):
+                        continue
+                    link["acks"] = True
+                    sent_at = in_flight.get(seq)
+                    # Frames are delivered in order, so an ack also covers every older frame
+                    while in_flight and next(iter(in_flight)) <= seq:
+                        in_flight.popitem(last=False)
+                    if sent_at is not None:
+                        link["backlog"] = 0.8 * link["backlog"] + 0.2 * (loop.time() - sent_at)
+                    wake.set()
+                elif kind == "config":
+                    cfg.update(_preview_ws_config(cfg, msg))
+                    if msg.get("acks"):
+                        link["acks"] = True
+                    link["config"] = True
+                    wake.set()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+        finally:
+            closed.set()
+            wake.set()
+
+    receiver = asyncio.create_task(receive_loop())
+    quality = cfg["quality"]
+    scale = 1.0
+    sent = dropped = ack_timeouts = seq = 0
+    width, height, frame_bytes = cfg["width"], cfg["height"], 0
+    last_status = 0.0
+    next_due = loop.time()
+    try:
+        while not closed.is_set():
+            interval = 1.0 / cfg["fps"]
+            if link.pop("config", False):
+                quality, scale = cfg["quality"], 1.0
+                await websocket.send_text(json.dumps({"type": "config", **cfg}))
+
+            now = loop.time()
+            if link["acks"] and in_flight:
+                # Frames unacked past the timeout count as lost. The window stays in force,
+                # so a dead or very late ack path throttles sending instead of unbounding it
+                timeout = max(PREVIEW_WS_ACK_TIMEOUT, PREVIEW_WS_ACK_TIMEOUT_FRAMES * interval)
+                expired = [n for n, sent_at in in_flight.items() if now - sent_at > timeout]
+                if expired:
+                    ack_timeouts += len(expired)
+                    link["backlog"] = max(link["backlog"], now - in_flight[expired[0]])
+                    for n in expired:
+                        del in_flight[n]
+            if now >= next_due:
+                if link["acks"] and len(in_flight) >= PREVIEW_WS_WINDOW:
+                    # Link is behind: skip this frame instead of queueing it
+                    dropped += 1
+                    oldest = now - next(iter(in_flight.values()))
+                    link["backlog"] = max(link["backlog"], oldest)
+                else:
+                    width = max(16, int(cfg["width"] * scale))
+                    height = max(16, int(cfg["height"] * scale))
+                    frame = generate_preview_frame(current_settings.get("ev", 0.0) or 0.0, (width, height), quality)
+                    frame_bytes = len(frame)
+                    seq += 1
+                    started = loop.time()
+                    in_flight[seq] = started
+                    if not link["acks"] and len(in_flight) > PREVIEW_WS_TRACKED:
+                        in_flight.popitem(last=False)
+                    await websocket.send_text(json.dumps({"type": "frame", "seq": seq}))
+                    await websocket.send_bytes(frame)
+                    if not link["acks"]:
+                        link["backlog"] = 0.8 * link["backlog"] + 0.2 * (loop.time() - started)
+                    sent += 1
+                next_due = max(next_due + interval, now)
+
+                if cfg["adaptive"]:
+                    budget = 0.5 * interval
+                    if link["backlog"] > budget:
+                        if quality > PREVIEW_WS_QUALITY_RANGE[0]:
+                            quality = max(PREVIEW_WS_QUALITY_RANGE[0], quality - 10)
+                        else:
+                            scale = max(0.25, scale * 0.75)
+                    elif link["backlog"] < 0.25 * budget:
+                        if scale < 1.0:
+                            scale = min(1.0, scale / 0.75)
+                        elif quality < cfg["quality"]:
+                            quality = min(cfg["quality"], quality + 5)
+
+            if now - last_status >= 1.0:
+                last_status = now
+                await websocket.send_text(json.dumps({"type": "status", **_status_state()}))
+                await websocket.send_text(json.dumps({
+                    "type": "stats", "sent": sent, "dropped": dropped,
+                    "inFlight": len(in_flight) if link["acks"] else 0,
+                    "ackTimeouts": ack_timeouts,
+                    "quality": quality, "width": width, "height": height, "bytes": frame_bytes,
+                    "backlogMs": round(link["backlog"] * 1000.0, 1),
+                }))
+
+            wake.clear()
+            try:
+                await asyncio.wait_for(wake.wait(), timeout=max(0.0, next_due - loop.time()))
+            except asyncio.TimeoutError:
+                pass
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        receiver.cancel()
+
+# --- Session manifests ---
+# Each session dir holds manifest.json (one record per frame); static/brackets/index.json
+# summarizes all sessions so listing and merging never scan or decode the file tree.
+BRACKETS_ROOT = os.path.join(STATIC_ROOT, 'brackets')
+SESSION_INDEX_PATH = os.path.join(BRACKETS_ROOT, 'index.json')
+MANIFEST_NAME = 'manifest.json'
+_manifest_lock = threading.Lock()
+_session_index: Optional[dict] = None
+
+def _write_file_atomic(path: str, data: bytes, check=None) -> str:
+    # Write to a uniquely named temp file in the same directory, then rename over the
+    # target; concurrent writers of the same path never share a temp file. check(tmp_path)
+    # may raise to reject the content, which leaves any existing target untouched.
+    # Returns the sha256 of the written bytes.
+    f = tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.",
+                                    suffix='.tmp', delete=False)
+    try:
+        with f:
+            f.write(data)
+        if check is not None:
+            check(f.name)
+        os.replace(f.name, path)
+    except BaseException:
+        try:
+            os.remove(f.name)
+        except OSError:
+            pass
+        raise
+    return hashlib.sha256(data).hexdigest()
+
+def _write_json_atomic(path: str, data) -> None:
+    _write_file_atomic(path, json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+def _session_summary(manifest: dict) -> dict:
+    frames = manifest.get("frames", [])
+    return {
+        "id": manifest["session"],
+        "created": manifest.get("created"),
+        "updated": manifest.get("updated"),
+        "frames": len(frames),
+        "evs": sorted({f["ev"] for f in frames}),
+        "full": sum(1 for f in frames if f.get("kind") == "full"),
+        "merged": bool(manifest.get("outputs")),
+    }
+
+def _parse_legacy_ev(filename: str) -> Optional[float]:
+    # ev_-1_0_full.jpg / ev_0.jpg -> EV; None when the name doesn't encode one
+    stem = os.path.splitext(filename)[0]
+    if not stem.startswith('ev_'):
+        return None
+    try:
+        return float(stem[3:].replace('_full', '').replace('_', '.'))
+    except ValueError:
+        return None
+
+def _legacy_frame_names(session_dir: str) -> List[tuple]:
+    found = []
+    for name in sorted(os.listdir(session_dir)):
+        ev = _parse_legacy_ev(name)
+        if ev is not None and os.path.splitext(name)[1].lower() in UPLOAD_EXTENSIONS:
+            found.append((name, ev))
+    return found
+
+def _legacy_summary(session: str, session_dir: str) -> dict:
+    # Index entry from file names alone; the full manifest (hashes, image info)
+    # is built the first time the session itself is opened
+    found = _legacy_frame_names(session_dir)
+    mtime = os.path.getmtime(session_dir)
+    return {
+        "id": session,
+        "created": mtime,
+        "updated": mtime,
+        "frames": len(found),
+        "evs": sorted({ev for _, ev in found}),
+        "full": sum(1 for name, _ in found if os.path.splitext(name)[0].endswith('_full')),
+        "merged": False,
+    }
+
+def _build_legacy_manifest(session: str, session_dir: str) -> dict:
+    # One-time migration for sessions captured before manifests existed
+    frames = []
+    for name, ev in _legacy_frame_names(session_dir):
+        path = os.path.join(session_dir, name)
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        width, height, exposure_time = _image_info(path)
+        frames.append({
+            "file": name,
+            "ev": ev,
+            "kind": "full" if os.path.splitext(name)[0].endswith('_full') else "bracket",
+            "exposureTime": exposure_time,
+            "width": width,
+            "height": height,
+            "bytes": os.path.getsize(path),
+            "sha256": digest,
+            "linear": is_linear_input(path),
+            "captured": os.path.getmtime(path),
+        })
+    created = min((f["captured"] for f in frames), default=os.path.getmtime(session_dir))
+    updated = max((f["captured"] for f in frames), default=created)
+    return {"session": session, "created": created, "updated": updated, "frames": frames, "outputs": {}}
+
+def _session_dir(session: str) -> str:
+    session = str(session)
+    if not session or session != os.path.basename(session) or session.startswith('.'):
+        raise HTTPException(status_code=400, detail="Invalid session id")
+    return os.path.join(BRACKETS_ROOT, session)
+
+# The *_locked helpers expect _manifest_lock to be held. They touch the disk, so the
+# async handlers reach them through run_in_threadpool(_get_manifest / _list_sessions /
+# _update_manifest) instead of blocking the event loop.
+def _session_index_locked() -> dict:
+    global _session_index
+    if _session_index is None:
+        try:
+            with open(SESSION_INDEX_PATH, 'r', encoding='utf-8') as f:
+                _session_index = json.load(f).get("sessions", {})
+        except (OSError, ValueError):
+            # No index yet: read existing manifests, summarize legacy dirs by file name
+            _session_index = {}
+            if os.path.isdir(BRACKETS_ROOT):
+                for name in os.listdir(BRACKETS_ROOT):
+                    session_dir = os.path.join(BRACKETS_ROOT, name)
+                    if name.startswith('.') or not os.path.isdir(session_dir):
+                        continue
+                    try:
+                        with open(os.path.join(session_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                            _session_index[name] = _session_summary(json.load(f))
+                    except (OSError, ValueError):
+                        _session_index[name] = _legacy_summary(name, session_dir)
+            os.makedirs(BRACKETS_ROOT, exist_ok=True)
+            _write_json_atomic(SESSION_INDEX_PATH, {"version": 1, "sessions": _session_index})
+    return _session_index
+
+def _save_index_entry_locked(manifest: dict) -> None:
+    index = _session_index_locked()
+    index[manifest["session"]] = _session_summary(manifest)
+    _write_json_atomic(SESSION_INDEX_PATH, {"version": 1, "sessions": index})
+
+def _load_manifest_locked(session: str) -> Optional[dict]:
+    session_dir = _session_dir(session)
+    try:
+        with open(os.path.join(session_dir, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    if not os.path.isdir(session_dir):
+        return None
+    # Legacy session: migrate it now and replace its name-only index entry
+    manifest = _build_legacy_manifest(str(session), session_dir)
+    _write_json_atomic(os.path.join(session_dir, MANIFEST_NAME), manifest)
+    _save_index_entry_locked(manifest)
+    return manifest
+
+def _new_manifest(session: str, now: float) -> dict:
+    return {"session": session, "created": now, "updated": now, "frames": [], "outputs": {}}
+
+def _create_session_dir(session: str) -> str:
+    # New sessions start with an empty manifest, so their first update never takes the
+    # legacy migration path (re-hashing files that were just written)
+    session_dir = _session_dir(session)
+    with _manifest_lock:
+        if not os.path.isdir(session_dir):
+            os.makedirs(session_dir)
+            _write_json_atomic(os.path.join(session_dir, MANIFEST_NAME), _new_manifest(str(session), time.time()))
+    return session_dir
+
+def _get_manifest(session: str) -> Optional[dict]:
+    with _manifest_lock:
+        return _load_manifest_locked(session)
+
+def _list_sessions() -> List[dict]:
+    with _manifest_lock:
+        return list(_session_index_locked().values())
+
+def _update_manifest(session: str, frames: Optional[List[dict]] = None, outputs: Optional[dict] = None) -> dict:
+    # Upsert frames (keyed by file name) and outputs, then persist manifest and index
+    session = str(session)
+    with _manifest_lock:
+        manifest = _load_manifest_locked(session)
+        now = time.time()
+        if manifest is None:
+            os.makedirs(_session_dir(session), exist_ok=True)
+            manifest = _new_manifest(session, now)
+        if frames:
+            by_file = {f["file"]: f for f in manifest["frames"]}
+            for frame in frames:
+                by_file[frame["file"]] = frame
+            manifest["frames"] = sorted(by_file.values(), key=lambda f: (f["ev"], f["kind"]))
+        if outputs:
+            manifest.setdefault("outputs", {}).update(outputs)
+        manifest["updated"] = now
+        _write_json_atomic(os.path.join(_session_dir(session), MANIFEST_NAME), manifest)
+        _save_index_entry_locked(manifest)
+        return manifest
+
+@app.get("/sessions")
+async def list_sessions(request: Request, token: Optional[str] = None, limit: int = 100, offset: int = 0):
+    if not _is_authorized(request, token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    sessions = await run_in_threadpool(_list_sessions)
+    sessions.sort(key=lambda s: s.get("updated") or 0, reverse=True)
+    limit = max(1, min(limit, 1000))
+    offset = max(0, offset)
+    return {"ok": True, "total": len(sessions), "sessions": sessions[offset:offset + limit]}
+
+@app.get("/sessions/{session}")
+async def get_session(session: str, request: Request, token: Optional[str] = None):
+    if not _is_authorized(request, token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    _session_dir(session)
+    manifest = await run_in_threadpool(_get_manifest, session)
+    if manifest is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"ok": True, "manifest": manifest}
+
 # --- HDR Bracketing ---
 class BracketRequest(BaseModel):
     exposures: Optional[List[float]] = None  # e.g., [-2, -1, 0, 1, 2]
@@ -251,7 +762,10 @@ class BracketRequest(BaseModel):
 async def photo_bracket(req: BracketRequest, request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
+    # Runs as one queued command: /settings calls arriving mid-bracket apply afterwards
+    return await camera_queue.submit("bracket", req)
 
+async def _run_bracket(req: BracketRequest) -> dict:
     exposures = req.exposures
     if not exposures and req.stops:
         # Build symmetric exposures around 0
@@ -272,59 +786,75 @@ async def photo_bracket(req: BracketRequest, request: Request, token: Optional[s
 
     # Prepare static output dir per session
     ts = int(time.time())
-    session_dir = os.path.join(STATIC_ROOT, 'brackets', str(ts))
-    try:
-        os.makedirs(session_dir, exist_ok=True)
-    except Exception:
-        pass
+    session_dir = await run_in_threadpool(_create_session_dir, str(ts))
 
     # Expected full-res (approx for 70.9MP, 2:1 ratio)
     expected_w, expected_h = 11904, 5952
     expected_mp = round((expected_w * expected_h) / 1_000_000, 2)
 
     results = []
-    for ev in exposures:
-        current_settings["exposureLock"] = bool(req.lockExposure)
-        current_settings["ev"] = float(ev)
-
-        # Generate small preview frame per EV
-        jpeg_bytes = generate_preview_frame(ev)
-        thumb_data = None
-        if req.includeThumbs:
-            thumb_data = "data:image/jpeg;base64," + base64.b64encode(jpeg_bytes).decode("ascii")
-
-        # Generate simulated "full" image and save to static files
-        full_obj = None
-        if req.includeFull:
-            full_w, full_h = 2048, 1024
-            img = Image.new('RGB', (full_w, full_h), color=(24, 24, 24))
-            draw = ImageDraw.Draw(img)
-            draw.text((20, 20), f"EV {ev:+.2f}", fill=(220, 220, 220))
-            draw.text((20, 44), f"Simulated Full", fill=(180, 180, 180))
-            # Save file
-            safe_ev = str(ev).replace('.', '_').replace('+', '')
-            filename = f"ev_{safe_ev}.jpg"
-            out_path = os.path.join(session_dir, filename)
-            try:
-                img.save(out_path, format='JPEG', quality=85)
-                full_obj = {
-                    "url": f"/files/brackets/{ts}/{filename}",
-                    "width": full_w,
-                    "height": full_h,
-                    "megapixels": round((full_w * full_h) / 1_000_000, 2),
-                    "expectedWidth": expected_w,
-                    "expectedHeight": expected_h,
-                    "expectedMegapixels": expected_mp,
-                }
-            except Exception:
-                full_obj = None
-
-        results.append({"ev": ev, "ok": True, "thumb": thumb_data, "full": full_obj})
-        await asyncio.sleep(delay)
-
-    # Restore previous settings
-    current_settings["ev"] = original_ev
-    current_settings["exposureLock"] = original_lock
+    frames = []
+    try:
+        for ev in exposures:
+            current_settings["exposureLock"] = bool(req.lockExposure)
+            current_settings["ev"] = float(ev)
+
+            # Generate small preview frame per EV
+            jpeg_bytes = generate_preview_frame(ev)
+            thumb_data = None
+            if req.includeThumbs:
+                thumb_data = "data:image/jpeg;base64," + base64.b64encode(jpeg_bytes).decode("ascii")
+
+            # Generate simulated "full" image and save to static files
+            full_obj = None
+            if req.includeFull:
+                full_w, full_h = 2048, 1024
+                img = Image.new('RGB', (full_w, full_h), color=(24, 24, 24))
+                draw = ImageDraw.Draw(img)
+                draw.text((20, 20), f"EV {ev:+.2f}", fill=(220, 220, 220))
+                draw.text((20, 44), f"Simulated Full", fill=(180, 180, 180))
+                # Save file
+                safe_ev = str(ev).replace('.', '_').replace('+', '')
+                filename = f"ev_{safe_ev}.jpg"
+                out_path = os.path.join(session_dir, filename)
+                try:
+                    buf = BytesIO()
+                    img.save(buf, format='JPEG', quality=85)
+                    data = buf.getvalue()
+                    digest = _write_file_atomic(out_path, data)
+                    frames.append({
+                        "file": filename,
+                        "ev": float(ev),
+                        "kind": "bracket",
+                        "exposureTime": None,
+                        "width": full_w,
+                        "height": full_h,
+                        "bytes": len(data),
+                        "sha256": digest,
+                        "linear": False,
+                        "captured": time.time(),
+                    })
+                    full_obj = {
+                        "url": f"/files/brackets/{ts}/{filename}",
+                        "width": full_w,
+                        "height": full_h,
+                        "megapixels": round((full_w * full_h) / 1_000_000, 2),
+                        "expectedWidth": expected_w,
+                        "expectedHeight": expected_h,
+                        "expectedMegapixels": expected_mp,
+                    }
+                except Exception:
+                    full_obj = None
+
+            results.append({"ev": ev, "ok": True, "thumb": thumb_data, "full": full_obj})
+            await asyncio.sleep(delay)
+    finally:
+        # Restore previous settings, also when the bracket is cancelled or fails
+        current_settings["ev"] = original_ev
+        current_settings["exposureLock"] = original_lock
+
+    if frames:
+        await run_in_threadpool(_update_manifest, str(ts), frames=frames)
 
     return {
         "ok": True,
@@ -336,29 +866,77 @@ async def photo_bracket(req: BracketRequest, request: Request, token: Optional[s
     }
 
 # Upload full-resolution image for a bracket session
+UPLOAD_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.dng')
+
+# Linear-input rules (DNG, 16-bit TIFF/PNG) and EXIF exposure times, shared with tools/hdr_merge.py
+TOOLS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tools'))
+if TOOLS_DIR not in sys.path:
+    sys.path.append(TOOLS_DIR)
+from linear_inputs import is_linear_input, exif_exposure_time
+
+def _image_info(path: str):
+    # Header-only read: (width, height, exposure time); DNG falls back to rawpy for the size
+    try:
+        with Image.open(path) as im:
+            return im.size[0], im.size[1], exif_exposure_time(im.getexif())
+    except Exception:
+        pass
+    try:
+        import rawpy
+        with rawpy.imread(path) as raw:
+            return raw.sizes.width, raw.sizes.height, None
+    except Exception:
+        return None, None, None
+
+def _require_image_info(path: str):
+    info = _image_info(path)
+    if info[0] is None:
+        # Neither Pillow nor rawpy can size it; a bogus "full" frame would break every later merge
+        raise HTTPException(status_code=415, detail="Unsupported or unreadable image")
+    return info
+
+def _store_upload(session: str, out_path: str, ev: float, data: bytes) -> dict:
+    # Inspect, write and record one uploaded frame (runs in the threadpool)
+    info = []
+    digest = _write_file_atomic(out_path, data, check=lambda tmp_path: info.append(_require_image_info(tmp_path)))
+    width, height, exposure_time = info[0]
+    frame = {
+        "file": os.path.basename(out_path),
+        "ev": ev,
+        "kind": "full",
+        "exposureTime": exposure_time,
+        "width": width,
+        "height": height,
+        "bytes": len(data),
+        "sha256": digest,
+        "linear": is_linear_input(out_path),
+        "captured": time.time(),
+    }
+    _update_manifest(session, frames=[frame])
+    return frame
+
 @app.post("/files/upload")
 async def files_upload(request: Request, token: Optional[str] = None, session: str = Form(...), ev: float = Form(...), file: UploadFile = File(...)):
     if not _is_authorized(request, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
     # Ensure session dir exists
-    session_dir = os.path.join(STATIC_ROOT, 'brackets', str(session))
+    session_dir = _session_dir(session)
     try:
-        os.makedirs(session_dir, exist_ok=True)
-    except Exception:
+        await run_in_threadpool(_create_session_dir, session)
+    except OSError:
         pass
-    # Save uploaded file
+    # Save uploaded file (keep linear formats: DNG, 16-bit TIFF/PNG)
+    ext = os.path.splitext(file.filename or '')[1].lower()
+    if ext not in UPLOAD_EXTENSIONS:
+        ext = '.jpg'
     safe_ev = str(ev).replace('.', '_').replace('+', '')
-    filename = f"ev_{safe_ev}_full.jpg"
+    filename = f"ev_{safe_ev}_full{ext}"
     out_path = os.path.join(session_dir, filename)
     try:
         data = await file.read()
-        with open(out_path, 'wb') as f:
-            f.write(data)
-        # Read dimensions
-        from PIL import Image
-        with Image.open(out_path) as im:
-            width, height = im.size
-        mp = round((width * height) / 1_000_000, 2)
+        frame = await run_in_threadpool(_store_upload, session, out_path, float(ev), data)
+        width, height = frame["width"], frame["height"]
+        mp = round((width * height) / 1_000_000, 2) if width and height else None
         return {
             "ok": True,
             "full": {
@@ -366,8 +944,13 @@ async def files_upload(request: Request, token: Optional[str] = None, session: s
                 "width": width,
                 "height": height,
                 "megapixels": mp,
+                "linear": frame["linear"],
+                "exposureTime": frame["exposureTime"],
+                "sha256": frame["sha256"],
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Upload failed: {e}")
 
@@ -383,45 +966,38 @@ class MergeRequest(BaseModel):
     tonemap: Optional[str] = None  # 'reinhard' | 'drago' | 'mantiuk' | None
     gamma: Optional[float] = 2.2
     exposures: Optional[List[float]] = None  # optional EV list fallback
+    half_size: Optional[bool] = False  # half-resolution decode of linear inputs (previews)
+    lighting: Optional[bool] = False  # lat-long mips, irradiance map and SH coefficients
 
 @app.post("/photo/bracket/merge")
 async def merge_bracket(req: MergeRequest, request: Request, token: Optional[str] = None):
     if not _is_authorized(request, token):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
-    # Resolve session dir
-    session_dir = os.path.join(STATIC_ROOT, 'brackets', str(req.session))
-    if not os.path.isdir(session_dir):
+    # Resolve session from its manifest
+    session_dir = _session_dir(req.session)
+    manifest = await run_in_threadpool(_get_manifest, req.session)
+    if manifest is None:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Collect images: prefer full uploads
-    files = []
+    # Collect frames: prefer full uploads, linear (DNG/TIFF/16-bit) over JPG
+    frames = []
     if req.use_full:
-        files = [os.path.join(session_dir, f) for f in os.listdir(session_dir) if f.lower().startswith('ev_') and f.lower().endswith('_full.jpg')]
-    if not files:
-        files = [os.path.join(session_dir, f) for f in os.listdir(session_dir) if f.lower().startswith('ev_') and f.lower().endswith('.jpg')]
-    if not files:
+        full = [f for f in manifest["frames"] if f["kind"] == "full"]
+        frames = [f for f in full if f["linear"]] or full
+    if not frames:
+        frames = [f for f in manifest["frames"] if f["kind"] == "bracket"]
+    if not frames:
         raise HTTPException(status_code=400, detail="No bracket images found")
-
-    # Sort by EV parsed from filename to maintain order
-    def parse_ev_from_name(name: str) -> float:
-        try:
-            base = os.path.basename(name)
-            # ev_-1_0_full.jpg or ev_0.jpg
-            s = base.split('.')[0].replace('ev_', '').replace('_full', '')
-            s = s.replace('_', '.')
-            return float(s)
-        except Exception:
-            return 0.0
-    files = sorted(files, key=parse_ev_from_name)
+    frames = sorted(frames, key=lambda f: f["ev"])
+    files = [os.path.join(session_dir, f["file"]) for f in frames]
 
     # Paths for outputs inside session
     out_hdr = os.path.join(session_dir, f"merged.{('exr' if req.format=='exr' else 'hdr')}")
     out_ldr = os.path.join(session_dir, "merged_preview.jpg")
 
     # Build CLI command
-    repo_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
-    hdr_merge_py = os.path.join(repo_root, 'tools', 'hdr_merge.py')
+    hdr_merge_py = os.path.join(TOOLS_DIR, 'hdr_merge.py')
     cmd = [
         'python', hdr_merge_py,
         '--files', *files,
@@ -430,17 +1006,30 @@ async def merge_bracket(req: MergeRequest, request: Request, token: Optional[str
     ]
     if req.align:
         cmd.append('--align')
-    # EV override if provided
+    linear = all(f["linear"] for f in frames)
+    if linear and req.half_size:
+        cmd.append('--half-size')
+    if req.lighting:
+        cmd.append('--lighting')
+    # EV override if provided, else exposure times or EVs recorded in the manifest
     if req.exposures and len(req.exposures) == len(files):
         cmd.append('--ev')
         cmd.extend([str(x) for x in req.exposures])
+    elif all(f.get("exposureTime") for f in frames):
+        cmd.append('--times')
+        cmd.extend([str(f["exposureTime"]) for f in frames])
+    else:
+        cmd.append('--ev')
+        cmd.extend([str(f["ev"]) for f in frames])
     # Tonemap preview optional
     if req.tonemap:
         cmd.extend(['--tonemap', req.tonemap, '--ldr-output', out_ldr, '--gamma', str(req.gamma or 2.2)])
 
     # Run tool
     try:
-        proc = subprocess.run(cmd, cwd=repo_root, capture_output=True, text=True, timeout=120)
+        # Off the event loop: the merge (plus --lighting mips/SH) takes seconds on full-res brackets
+        proc = await run_in_threadpool(subprocess.run, cmd, cwd=os.path.dirname(TOOLS_DIR),
+                                       capture_output=True, text=True, timeout=120)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Merge execution failed: {e}")
     if proc.returncode != 0:
@@ -453,9 +1042,240 @@ async def merge_bracket(req: MergeRequest, request: Request, token: Optional[str
         "ok": True,
         "output": {
             "url": url_hdr,
-            "format": req.format or 'exr'
+            "format": req.format or 'exr',
+            "linear": linear
         }
     }
     if req.tonemap:
         resp["preview"] = { "url": f"/files/brackets/{req.session}/merged_preview.jpg", "method": req.tonemap, "gamma": req.gamma or 2.2 }
-    return resp
\ No newline at end of file
+    if req.lighting:
+        try:
+            with open(os.path.join(session_dir, "merged_lighting.json"), 'r', encoding='utf-8') as f:
+                lighting = json.load(f)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Lighting output missing: {e}")
+        base_url = f"/files/brackets/{req.session}"
+        resp["lighting"] = {
+            "url": f"{base_url}/merged_lighting.json",
+            "convention": lighting.get("convention"),
+            "sh": lighting.get("sh"),
+            "irradiance": {**lighting["irradiance"], "url": f"{base_url}/{lighting['irradiance']['file']}"},
+            "mips": [{**m, "url": f"{base_url}/{m['file']}"} for m in lighting.get("mips", [])],
+        }
+    await run_in_threadpool(_update_manifest, req.session, outputs={
+        "merged": {"url": url_hdr, "format": req.format or 'exr', "linear": linear,
+                   "frames": [f["file"] for f in frames], "created": time.time()},
+        **({"preview": resp["preview"]} if "preview" in resp else {}),
+        **({"lighting": resp["lighting"]["url"]} if "lighting" in resp else {}),
+    })
+    return resp
+
+# --- Image derivatives (resized JPEG / tonemapped HDR views) ---
+# Served from a size-bounded LRU disk cache; cache keys include the source mtime,
+# so a re-uploaded frame yields a new ETag and stale derivatives age out.
+os.environ.setdefault('OPENCV_IO_ENABLE_OPENEXR', '1')
+try:
+    import numpy as np
+    import cv2  # optional: HDR/EXR and 16-bit sources
+    HAS_CV2 = True
+except Exception:
+    HAS_CV2 = False
+
+DERIVATIVE_CACHE_DIR = os.path.join(os.path.dirname(__file__), 'cache', 'derivatives')
+DERIVATIVE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+DERIVATIVE_MAX_SIDE = 4096
+HDR_EXTENSIONS = ('.exr', '.hdr')
+
+class DerivativeCache:
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._entries: Optional[OrderedDict] = None  # key -> size, oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def _load(self) -> OrderedDict:
+        # Rebuild LRU order from file mtimes once per process
+        if self._entries is None:
+            os.makedirs(self.root, exist_ok=True)
+            found = []
+            for name in os.listdir(self.root):
+                if name.endswith('.jpg'):
+                    st = os.stat(os.path.join(self.root, name))
+                    found.append((st.st_mtime, name[:-4], st.st_size))
+            self._entries = OrderedDict((key, size) for _, key, size in sorted(found))
+            self._total = sum(self._entries.values())
+        return self._entries
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, f"{key}.jpg")
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entries = self._load()
+            if key not in entries:
+                return None
+            entries.move_to_end(key)
+            path = self._path(key)
+            try:
+                os.utime(path)
+                with open(path, 'rb') as f:
+                    return f.read()
+            except OSError:
+                self._total -= entries.pop(key)
+                return None
+
+    def put(self, key: str, data: bytes) -> None:
+        with self._lock:
+            entries = self._load()
+            _write_file_atomic(self._path(key), data)
+            self._total += len(data) - entries.pop(key, 0)
+            entries[key] = len(data)
+            while self._total > self.max_bytes and len(entries) > 1:
+                old_key, old_size = entries.popitem(last=False)
+                self._total -= old_size
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+
+derivative_cache = DerivativeCache(DERIVATIVE_CACHE_DIR, DERIVATIVE_CACHE_MAX_BYTES)
+
+def _fit_size(width: int, height: int, max_w: int, max_h: int):
+    scale = min(max_w / width, max_h / height, 1.0)
+    return max(1, int(round(width * scale))), max(1, int(round(height * scale)))
+
+def _tonemap_to_rgb8(hdr_bgr, max_w: int, max_h: int):
+    # Downsample first, then global Reinhard (key 0.18) + gamma 2.2
+    h, w = hdr_bgr.shape[:2]
+    tw, th = _fit_size(w, h, max_w, max_h)
+    if (tw, th) != (w, h):
+        hdr_bgr = cv2.resize(hdr_bgr, (tw, th), interpolation=cv2.INTER_AREA)
+    hdr = np.maximum(hdr_bgr[:, :, ::-1].astype(np.float32), 0.0)
+    lum = 0.2126 * hdr[:, :, 0] + 0.7152 * hdr[:, :, 1] + 0.0722 * hdr[:, :, 2]
+    log_avg = float(np.exp(np.mean(np.log(lum + 1e-6))))
+    scaled = lum * (0.18 / max(log_avg, 1e-6))
+    ratio = (scaled / (1.0 + scaled)) / np.maximum(lum, 1e-6)
+    ldr = np.clip(hdr * ratio[:, :, None], 0.0, 1.0) ** (1.0 / 2.2)
+    return Image.fromarray((ldr * 255.0 + 0.5).astype(np.uint8), 'RGB')
+
+def _render_derivative(src_path: str, max_w: int, max_h: int, quality: int) -> bytes:
+    ext = os.path.splitext(src_path)[1].lower()
+    if ext in HDR_EXTENSIONS:
+        if not HAS_CV2:
+            raise HTTPException(status_code=415, detail="HDR previews need opencv-python and numpy")
+        hdr = cv2.imread(src_path, cv2.IMREAD_UNCHANGED)
+        if hdr is None:
+            raise HTTPException(status_code=415, detail="Unreadable HDR image")
+        img = _tonemap_to_rgb8(hdr[:, :, :3], max_w, max_h)
+    elif ext == '.dng':
+        # Embedded JPEG preview is far cheaper than demosaicing
+        try:
+            import rawpy
+            with rawpy.imread(src_path) as raw:
+                thumb = raw.extract_thumb()
+            if thumb.format != rawpy.ThumbFormat.JPEG:
+                raise ValueError("no JPEG thumbnail")
+            img = Image.open(BytesIO(thumb.data))
+        except HTTPException:
+            raise
+        except Exception:
+            raise HTTPException(status_code=415, detail="DNG previews need rawpy and an embedded JPEG thumbnail")
+    elif is_linear_input(src_path) and HAS_CV2:
+        lin = cv2.imread(src_path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_COLOR)
+        if lin is None:
+            raise HTTPException(status_code=415, detail="Unreadable image")
+        h, w = lin.shape[:2]
+        tw, th = _fit_size(w, h, max_w, max_h)
+        dtype = lin.dtype
+        lin = cv2.resize(lin, (tw, th), interpolation=cv2.INTER_AREA).astype(np.float32)
+        # Scale by the container's range, not the pixel values (dark 16-bit frames stay dark)
+        if np.issubdtype(dtype, np.integer):
+            lin *= 1.0 / float(np.iinfo(dtype).max)
+        rgb = np.clip(lin[:, :, ::-1], 0.0, 1.0) ** (1.0 / 2.2)
+        img = Image.fromarray((rgb * 255.0 + 0.5).astype(np.uint8), 'RGB')
+    else:
+        try:
+            img = Image.open(src_path)
+            # JPEG: decode at 1/2, 1/4 or 1/8 scale directly in the DCT domain
+            img.draft('RGB', (max_w, max_h))
+            img.load()
+        except (UnidentifiedImageError, OSError):
+            # manifest.json, merged_lighting.json, truncated uploads, ...
+            raise HTTPException(status_code=415, detail="Not a previewable image")
+    img = img.convert('RGB')
+    img.thumbnail((max_w, max_h), Image.BILINEAR, reducing_gap=2.0)
+    buf = BytesIO()
+    img.save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+def _byte_range(range_header: str, length: int):
+    # Single "bytes=a-b" / "bytes=a-" / "bytes=-n" range -> (start, end) inclusive, or None if unsatisfiable
+    unit, _, spec = range_header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None
+    start_s, _, end_s = spec.strip().partition('-')
+    try:
+        if start_s == '':
+            n = int(end_s)
+            if n <= 0:
+                return None
+            return max(0, length - n), length - 1
+        start = int(start_s)
+        end = int(end_s) if end_s else length - 1
+    except ValueError:
+        return None
+    if start >= length or end < start:
+        return None
+    return start, min(end, length - 1)
+
+def _derivative_key(path: str, max_w: int, max_h: int, quality: int):
+    # -> (source path, cache key); the key changes whenever the source is rewritten
+    root = os.path.realpath(STATIC_ROOT)
+    src_path = os.path.realpath(os.path.join(root, path))
+    if not src_path.startswith(root + os.sep) or not os.path.isfile(src_path):
+        raise HTTPException(status_code=404, detail="Not found")
+    st = os.stat(src_path)
+    key = hashlib.sha1(f"{src_path}|{st.st_mtime_ns}|{st.st_size}|{max_w}|{max_h}|{quality}".encode('utf-8')).hexdigest()
+    return src_path, key
+
+@app.get("/derivatives/{path:path}")
+async def derivative(path: str, request: Request, token: Optional[str] = None,
+                     w: int = 640, h: int = 640, q: int = 75):
+    if not _is_authorized(request, token):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    max_w = max(16, min(w, DERIVATIVE_MAX_SIDE))
+    max_h = max(16, min(h, DERIVATIVE_MAX_SIDE))
+    quality = max(20, min(q, 95))
+
+    # Filesystem and cache calls (stat, utime, reads, the cache lock) all run in the threadpool
+    src_path, key = await run_in_threadpool(_derivative_key, path, max_w, max_h, quality)
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "private, max-age=86400",
+        "Accept-Ranges": "bytes",
+    }
+    if etag in [t.strip() for t in request.headers.get("If-None-Match", "").split(',')]:
+        return Response(status_code=304, headers=headers)
+
+    data = await run_in_threadpool(derivative_cache.get, key)
+    if data is None:
+        data = await run_in_threadpool(_render_derivative, src_path, max_w, max_h, quality)
+        await run_in_threadpool(derivative_cache.put, key, data)
+
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (if_range is None or if_range == etag):
+        span = _byte_range(range_header, len(data))
+        if span is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{len(data)}"})
+        start, end = span
+        return Response(content=data[start:end + 1], status_code=206, media_type="image/jpeg", headers={
+            **headers,
+            "Content-Range": f"bytes {start}-{end}/{len(data)}",
+        })
+    return Response(content=data, media_type="image/jpeg", headers=headers)
+
+# Mounted last so POST /files/upload isn't shadowed by the static mount
+app.mount('/files', StaticFiles(directory=STATIC_ROOT), name='files')
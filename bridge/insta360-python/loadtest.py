@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+Load test for the Insta360 bridge (app.py) against the mock camera state.
+
+Starts the app with uvicorn in a subprocess (scratch static dir via BRIDGE_STATIC_ROOT)
+and simulates concurrent clients:
+- MJPEG viewers (/preview.mjpeg), WebSocket viewers (/preview/ws)
+- SSE subscribers (/events) and long-pollers (/events/poll)
+- bracket captures (/photo/bracket), large uploads (/files/upload), merges (/photo/bracket/merge)
+
+Each workload runs alone first (per-endpoint memory and loop lag), then all together ("mixed").
+Per endpoint it reports throughput, p50/p99 latency, errors, event-loop lag and server RSS.
+Event-loop lag is probed from outside: a trivial GET /info every 100 ms, whose latency
+rises with the time the server loop is blocked. RSS is read from /proc (Linux).
+
+Requirements:
+  pip install httpx uvicorn
+  # optional: WebSocket viewers
+  pip install websockets
+
+Examples:
+  python loadtest.py --mjpeg 20 --sse 50 --poll 20 --duration 15
+  python loadtest.py --bracket 2 --upload 4 --upload-mb 30 --merge 1 --json before.json
+  # after a change: fail (exit 1) on >10 % throughput drop or p99 increase
+  python loadtest.py --mjpeg 20 --sse 50 --poll 20 --compare before.json --tolerance 0.1
+
+Notes:
+- Stream latencies are inter-frame/inter-event gaps (MJPEG nominal 200 ms, SSE 1 s).
+- Merges need opencv-python/numpy in the server environment; failures count as errors.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from io import BytesIO
+from typing import Dict, List, Optional
+
+try:
+    import httpx
+except Exception:
+    print('[FAIL] httpx is required: pip install httpx')
+    sys.exit(1)
+
+try:
+    import websockets  # optional
+    HAS_WEBSOCKETS = True
+except Exception:
+    HAS_WEBSOCKETS = False
+
+TOKEN = 'devtoken'
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+WORKLOADS = ('mjpeg', 'ws', 'sse', 'poll', 'bracket', 'upload', 'merge')
+MIN_P99_SAMPLES = 50
+
+
+def percentile(values: List[float], p: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+class Recorder:
+    """Latency samples (seconds), completed operations, bytes and errors for one endpoint."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.count = 0
+        self.bytes = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def ok(self, latency: Optional[float] = None, nbytes: int = 0):
+        self.count += 1
+        self.bytes += nbytes
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def fail(self, err: Exception):
+        self.errors += 1
+        self.last_error = f'{type(err).__name__}: {err}'[:200]
+
+    def summary(self, duration: float) -> dict:
+        ms = lambda v: None if v is None else round(v * 1000.0, 1)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'throughput': round(self.count / duration, 2),
+            'mbPerSec': round(self.bytes / duration / 1e6, 2),
+            'p50Ms': ms(percentile(self.latencies, 50)),
+            'p99Ms': ms(percentile(self.latencies, 99)),
+            'lastError': self.last_error,
+        }
+
+
+# --- Server process ---
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port: int, static_root: str) -> subprocess.Popen:
+    env = dict(os.environ, BRIDGE_STATIC_ROOT=static_root)
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app:app', '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning'],
+        cwd=APP_DIR, env=env,
+    )
+    deadline = time.time() + 20
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError('Bridge exited during startup')
+        try:
+            if httpx.get(f'http://127.0.0.1:{port}/info', params={'token': TOKEN}, timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError('Bridge did not start within 20 s')
+
+
+def read_rss_mb(pid: int) -> Optional[float]:
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+# --- Client workloads ---
+
+async def mjpeg_viewer(client: httpx.AsyncClient, stop: asyncio.Event, rec: Recorder):
+    try:
+        async with client.stream('GET', '/preview.mjpeg', timeout=None) as resp:
+            boundary = b'--frame\r\n'
+            last = None
+            tail = b''
+            async for chunk in resp.aiter_bytes():
+                # Keep fewer bytes than the boundary so a split boundary is counted exactly once
+                data = tail + chunk
+                frames = data.count(boundary)
+                tail = data[-(len(boundary) - 1):]
+                rec.bytes += len(chunk)
+                now = time.perf_counter()
+                for _ in range(frames):
+                    rec.ok(None if last is None else now - last)
+                    last = now
+                if stop.is_set():
+                    break
+    except Exception as e:
+        if not stop.is_set():
+            rec.fail(e)
+
+
+async def ws_viewer(base_ws: str, stop: asyncio.Event, rec: Recorder, fps: float):
+    if not HAS_WEBSOCKETS:
+        rec.fail(RuntimeError('websockets not installed'))
+        return
+    try:
+        async with websockets.connect(f'{base_ws}/preview/ws?token={TOKEN}', max_size=None) as ws:
+            await ws.send(json.dumps({'type': 'config', 'fps': fps, 'acks': True}))
+            last = seq = None
+            while not stop.is_set():
+                try:
+                    msg = await asyncio.wait_for(ws.recv(), timeout=1.0)
+                except asyncio.TimeoutError:
+                    continue
+                if isinstance(msg, bytes):
+                    now = time.perf_counter()
+                    rec.ok(None if last is None else now - last, len(msg))
+                    last = now
+                    if seq is not None:
+                        await ws.send(json.dumps({'type': 'ack', 'seq': seq}))
+                else:
+                    data = json.loads(msg)
+                    if data.get('type') == 'frame':
+                        seq = data['seq']
+    except Exception as e:
+        if not stop.is_set():
+            rec.fail(e)
+
+
+async def sse_subscriber(client: httpx.AsyncClient, stop: asyncio.Event, rec: Recorder):
+    try:
+        async with client.stream('GET', '/events', timeout=None) as resp:
+            last = None
+            async for line in resp.aiter_lines():
+                if line.startswith('data:'):
+                    now = time.perf_counter()
+                    rec.ok(None if last is None else now - last, len(line))
+                    last = now
+                if stop.is_set():
+                    break
+    except Exception as e:
+        if not stop.is_set():
+            rec.fail(e)
+
+
+async def request_loop(stop: asyncio.Event, rec: Recorder, call, interval: float = 0.0, sent_bytes: int = 0):
+    # Bytes count the response, or the request body when sent_bytes is given (uploads)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            resp = await call()
+            resp.raise_for_status()
+            rec.ok(time.perf_counter() - started, sent_bytes or len(resp.content))
+        except Exception as e:
+            rec.fail(e)
+        if interval:
+            await asyncio.sleep(interval)
+
+
+def make_upload_payload(size_mb: float) -> bytes:
+    """Small valid JPEG padded after EOI: the bridge reads the header only, transfer size is what counts."""
+    from PIL import Image
+    buf = BytesIO()
+    Image.new('RGB', (1024, 512), color=(90, 90, 90)).save(buf, format='JPEG', quality=80)
+    data = buf.getvalue()
+    return data + b'\0' * max(0, int(size_mb * 1024 * 1024) - len(data))
+
+
+async def lag_probe(client: httpx.AsyncClient, stop: asyncio.Event, rec: Recorder):
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            resp = await client.get('/info')
+            resp.raise_for_status()
+            rec.ok(time.perf_counter() - started)
+        except Exception as e:
+            rec.fail(e)
+        await asyncio.sleep(0.1)
+
+
+async def rss_sampler(pid: int, stop: asyncio.Event, samples: List[float]):
+    while not stop.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            samples.append(rss)
+        await asyncio.sleep(0.5)
+
+
+async def run_phase(base_url: str, pid: int, counts: Dict[str, int], args) -> dict:
+    stop = asyncio.Event()
+    recorders = {name: Recorder() for name, n in counts.items() if n > 0}
+    lag = Recorder()
+    rss: List[float] = []
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    async with httpx.AsyncClient(base_url=base_url, params={'token': TOKEN}, limits=limits,
+                                 timeout=httpx.Timeout(120.0)) as client:
+        merge_session = None
+        if counts.get('merge'):
+            resp = await client.post('/photo/bracket', json={'delayMs': 0, 'includeThumbs': False, 'includeFull': True})
+            merge_session = str(resp.json()['session']['id'])
+        payload = make_upload_payload(args.upload_mb) if counts.get('upload') else b''
+
+        rss_before = read_rss_mb(pid)
+        tasks = [asyncio.create_task(lag_probe(client, stop, lag)), asyncio.create_task(rss_sampler(pid, stop, rss))]
+        for i in range(counts.get('mjpeg', 0)):
+            tasks.append(asyncio.create_task(mjpeg_viewer(client, stop, recorders['mjpeg'])))
+        for i in range(counts.get('ws', 0)):
+            tasks.append(asyncio.create_task(ws_viewer(base_url.replace('http', 'ws', 1), stop, recorders['ws'], args.ws_fps)))
+        for i in range(counts.get('sse', 0)):
+            tasks.append(asyncio.create_task(sse_subscriber(client, stop, recorders['sse'])))
+        for i in range(counts.get('poll', 0)):
+            tasks.append(asyncio.create_task(request_loop(
+                stop, recorders['poll'], lambda: client.get('/events/poll'), args.poll_interval)))
+        for i in range(counts.get('bracket', 0)):
+            tasks.append(asyncio.create_task(request_loop(
+                stop, recorders['bracket'],
+                lambda: client.post('/photo/bracket', json={'delayMs': 50, 'includeThumbs': True, 'includeFull': True}))))
+        for i in range(counts.get('upload', 0)):
+            session = f'loadtest-upload-{i}'
+            tasks.append(asyncio.create_task(request_loop(
+                stop, recorders['upload'],
+                lambda s=session: client.post('/files/upload', data={'session': s, 'ev': '0'},
+                                              files={'file': ('frame.jpg', payload, 'image/jpeg')}),
+                sent_bytes=len(payload))))
+        for i in range(counts.get('merge', 0)):
+            tasks.append(asyncio.create_task(request_loop(
+                stop, recorders['merge'],
+                lambda: client.post('/photo/bracket/merge', json={'session': merge_session, 'format': 'hdr', 'align': False}))))
+
+        started = time.perf_counter()
+        await asyncio.sleep(args.duration)
+        stop.set()
+        duration = time.perf_counter() - started
+        # Streams only notice stop on their next chunk; don't wait for long requests to drain
+        done, pending = await asyncio.wait(tasks, timeout=5)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    result = {name: {'clients': counts[name], **rec.summary(duration)} for name, rec in recorders.items()}
+    lag_summary = lag.summary(duration)
+    result['_server'] = {
+        'loopLagP50Ms': lag_summary['p50Ms'],
+        'loopLagP99Ms': lag_summary['p99Ms'],
+        'probeErrors': lag_summary['errors'],
+        'rssStartMb': None if rss_before is None else round(rss_before, 1),
+        'rssPeakMb': round(max(rss), 1) if rss else None,
+    }
+    return result
+
+
+def print_phase(name: str, result: dict):
+    srv = result['_server']
+    print(f'\n== {name} ==  loop lag p50/p99: {srv["loopLagP50Ms"]}/{srv["loopLagP99Ms"]} ms | '
+          f'RSS start/peak: {srv["rssStartMb"]}/{srv["rssPeakMb"]} MB')
+    print(f'{"endpoint":<10}{"ops":>8}{"ops/s":>10}{"MB/s":>9}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for endpoint, r in result.items():
+        if endpoint.startswith('_'):
+            continue
+        print(f'{endpoint:<10}{r["count"]:>8}{r["throughput"]:>10}{r["mbPerSec"]:>9}'
+              f'{str(r["p50Ms"]):>10}{str(r["p99Ms"]):>10}{r["errors"]:>8}')
+        if r['lastError']:
+            print(f'{"":<10}last error: {r["lastError"]}')
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Per-client throughput drops or p99 increases beyond tolerance (p99 also needs > 5 ms absolute)."""
+    regressions = []
+    for phase, endpoints in current.items():
+        for endpoint, r in endpoints.items():
+            b = baseline.get(phase, {}).get(endpoint)
+            if endpoint.startswith('_') or not b:
+                continue
+            per_client = r['throughput'] / max(1, r['clients'])
+            base_per_client = b['throughput'] / max(1, b.get('clients', 1))
+            if base_per_client and per_client < base_per_client * (1.0 - tolerance):
+                regressions.append(f'{phase}/{endpoint}: throughput/client {base_per_client:.2f} -> {per_client:.2f} ops/s')
+            # p99 of a handful of samples is noise; only compare well-populated endpoints
+            if min(r['count'], b['count']) < MIN_P99_SAMPLES or not (b['p99Ms'] and r['p99Ms']):
+                continue
+            if r['p99Ms'] > b['p99Ms'] * (1.0 + tolerance) and r['p99Ms'] - b['p99Ms'] > 5.0:
+                regressions.append(f'{phase}/{endpoint}: p99 {b["p99Ms"]} -> {r["p99Ms"]} ms')
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser(description='Load test the Insta360 bridge with simulated clients.')
+    ap.add_argument('--mjpeg', type=int, default=10, help='MJPEG viewers')
+    ap.add_argument('--ws', type=int, default=0, help='WebSocket preview viewers (needs websockets)')
+    ap.add_argument('--sse', type=int, default=20, help='SSE subscribers')
+    ap.add_argument('--poll', type=int, default=10, help='Long-pollers')
+    ap.add_argument('--bracket', type=int, default=1, help='Clients capturing brackets back to back')
+    ap.add_argument('--upload', type=int, default=2, help='Clients uploading full frames back to back')
+    ap.add_argument('--merge', type=int, default=0, help='Clients merging a bracket session back to back')
+    ap.add_argument('--upload-mb', type=float, default=30.0, help='Upload size in MB')
+    ap.add_argument('--poll-interval', type=float, default=0.25, help='Pause between long-poll requests (s)')
+    ap.add_argument('--ws-fps', type=float, default=10.0, help='Requested WebSocket preview fps')
+    ap.add_argument('--duration', type=float, default=10.0, help='Seconds per phase')
+    ap.add_argument('--no-isolate', action='store_true', help='Skip the per-workload phases, run only the mixed phase')
+    ap.add_argument('--url', help='Use a running bridge instead of starting one (no RSS figures)')
+    ap.add_argument('--json', help='Write results as JSON (baseline for --compare)')
+    ap.add_argument('--compare', help='Baseline JSON; exit 1 on regressions')
+    ap.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative regression for --compare')
+    args = ap.parse_args()
+
+    counts = {name: getattr(args, name) for name in WORKLOADS}
+    phases = []
+    if not args.no_isolate:
+        phases.extend((name, {name: n}) for name, n in counts.items() if n > 0)
+    phases.append(('mixed', counts))
+
+    static_root = tempfile.mkdtemp(prefix='bridge-loadtest-')
+    proc = None
+    try:
+        if args.url:
+            base_url, pid = args.url.rstrip('/'), -1
+        else:
+            port = free_port()
+            proc = start_server(port, static_root)
+            base_url, pid = f'http://127.0.0.1:{port}', proc.pid
+        print(f'[INFO] Bridge: {base_url} | clients: {counts} | {args.duration:g} s per phase')
+
+        results = {}
+        for name, phase_counts in phases:
+            results[name] = asyncio.run(run_phase(base_url, pid, phase_counts, args))
+            print_phase(name, results[name])
+
+        if args.json:
+            with open(args.json, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+            print(f'\n[OK] Results written: {args.json}')
+
+        if args.compare:
+            with open(args.compare, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+            regressions = compare(results, baseline, args.tolerance)
+            if regressions:
+                print('\n[FAIL] Regressions against', args.compare)
+                for line in regressions:
+                    print('  -', line)
+                sys.exit(1)
+            print(f'\n[OK] No regressions against {args.compare} (tolerance {args.tolerance:.0%})')
+    except RuntimeError as e:
+        print('[FAIL]', e)
+        sys.exit(1)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        shutil.rmtree(static_root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,11 +10,14 @@ Abhängigkeiten:
 - pillow (für EXIF)
 - numpy
 - optional: OpenEXR, Imath (falls cv2 kein EXR schreiben kann)
+- optional: rawpy (für DNG/RAW‑Eingaben)
 
 Installation:
   pip install opencv-python pillow numpy
   # optional für EXR
   pip install OpenEXR Imath
+  # optional für DNG
+  pip install rawpy
 
 Beispiele:
   # Verzeichnis mit EXIF-Zeiten
@@ -33,14 +36,32 @@ Beispiele:
   python tools/hdr_merge.py --input ./brackets --output ./out.exr \
     --tonemap reinhard --ldr-output ./out_preview.png --gamma 2.2
 
+  # Lineare Eingaben (DNG, 16‑Bit TIFF/PNG) – ohne Response‑Kalibrierung
+  python tools/hdr_merge.py --files IMG_001.dng IMG_002.dng IMG_003.dng \
+    --ev -2 0 2 --output ./out.exr
+
+  # Schnelle Vorschau aus DNG in halber Auflösung
+  python tools/hdr_merge.py --input ./raw_brackets --output ./preview.hdr --half-size
+
+  # Lookdev‑Beleuchtung: out_mip1..6.exr, out_irradiance.exr, out_lighting.json (SH)
+  python tools/hdr_merge.py --input ./brackets --output ./out.exr --lighting
+
 Hinweise:
 - Für bestes Ergebnis sind echte Belichtungszeiten (EXIF) notwendig; andernfalls werden Zeiten geschätzt.
 - Mit --ev werden relative Belichtungen verwendet (t ~ 2^EV); absolute Skala ist weniger wichtig.
 - --align nutzt MTB, um Bracket-Bilder vor dem Merge auszurichten.
 - --ldr-output schreibt eine LDR-Preview mit wählbarem Tonemapping.
+- DNG sowie 16‑Bit TIFF/PNG gelten als linear: Merge direkt im linearen Raum mit
+  belichtungsnormierter Gewichtung, --method wird dann ignoriert.
+- --half-size: DNG wird direkt in halber Auflösung dekodiert (ohne Demosaicing); 16‑Bit TIFF/PNG
+  werden voll dekodiert und dann jedes zweite Pixel übernommen (OpenCV kann nur 8 Bit reduziert
+  dekodieren; Flächenmittelung würde geclippte Pixel mit gültigen vermischen).
+- --lighting erwartet eine 2:1 Lat‑Long‑Map (z. B. Insta360) und berechnet Mips, Irradiance und
+  SH‑Koeffizienten (Band 0–2) raumwinkelgewichtet in einem Durchgang.
 """
 
 import argparse
+import json
 import os
 import sys
 from typing import List, Tuple
@@ -54,14 +75,27 @@ try:
 except Exception:
     HAS_OPENEXR = False
 
+try:
+    import rawpy  # optional
+    HAS_RAWPY = True
+except Exception:
+    HAS_RAWPY = False
+
+# DNG ist immer linear; TIFF (wie PNG) nur ab 16 Bit pro Kanal – Regel geteilt mit der Bridge
+from linear_inputs import RAW_EXTENSIONS, TIFF_EXTENSIONS, LINEAR_EXTENSIONS, is_linear_input, exif_exposure_time
+
+# Grenzen für die Gewichtung linearer Daten (normiert auf [0..1])
+LINEAR_NOISE_FLOOR = 0.002
+LINEAR_SATURATION = 0.92
+
 
 def read_images_and_times(input_dir: str) -> Tuple[List[np.ndarray], np.ndarray]:
     """Liest JPGs aus dem Verzeichnis und extrahiert Belichtungszeiten (Sekunden) aus EXIF.
     Falls EXIF fehlt, schätzt Zeiten über relative Helligkeit.
     """
-    files = sorted([f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))])
+    files = sorted([f for f in os.listdir(input_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png') + TIFF_EXTENSIONS)])
     if not files:
-        raise RuntimeError('Keine Bilder gefunden. Erwarte JPG/JPEG/PNG im Eingabeordner.')
+        raise RuntimeError('Keine Bilder gefunden. Erwarte JPG/JPEG/PNG/TIFF im Eingabeordner.')
 
     images = []
     times = []
@@ -251,6 +285,156 @@ def read_images_and_times_from_list(files: List[str], evs: List[float] = None, t
     return images, times_est
 
 
+def _exif_exposure_time(path: str):
+    """Belichtungszeit (Sekunden) aus EXIF oder None."""
+    try:
+        with Image.open(path) as im:
+            return exif_exposure_time(im.getexif())
+    except Exception:
+        return None
+
+
+def read_linear_image(path: str, half_size: bool = False) -> np.ndarray:
+    """Liest eine lineare Eingabe als float32 BGR, normiert auf [0..1].
+    DNG über rawpy (Gamma 1, ohne Auto‑Helligkeit), TIFF/PNG über OpenCV mit voller Bit‑Tiefe.
+    Alpha wird verworfen, Graustufen auf drei Kanäle erweitert.
+    half_size: nur DNG wird wirklich in halber Auflösung dekodiert (ohne Demosaicing). OpenCVs
+    reduzierte Dekodierung (IMREAD_REDUCED_*) liefert nur 8 Bit, daher werden TIFF/PNG voll
+    dekodiert und dann jedes zweite Pixel übernommen – das spart nur Zeit und Speicher im Merge.
+    Bewusst keine Flächenmittelung: gemischte Blöcke aus geclippten und gültigen Pixeln sähen
+    sonst gültig aus und verfälschten Zeitschätzung und Gewichte an Lichtkanten.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in RAW_EXTENSIONS:
+        if not HAS_RAWPY:
+            raise RuntimeError('DNG‑Eingaben benötigen "rawpy" (pip install rawpy).')
+        with rawpy.imread(path) as raw:
+            rgb16 = raw.postprocess(
+                gamma=(1, 1),
+                no_auto_bright=True,
+                output_bps=16,
+                use_camera_wb=True,
+                half_size=half_size,
+            )
+        return rgb16[:, :, ::-1].astype(np.float32) * (1.0 / 65535.0)
+
+    img = cv2.imread(path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_ANYCOLOR)
+    if img is None:
+        raise RuntimeError(f'Bild kann nicht gelesen werden: {path}')
+    if half_size:
+        img = img[::2, ::2]
+    if img.ndim == 2:
+        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    elif img.shape[2] == 4:
+        img = img[:, :, :3]
+    if img.dtype == np.uint16:
+        scale = 1.0 / 65535.0
+    elif img.dtype == np.uint8:
+        scale = 1.0 / 255.0
+    else:
+        scale = 1.0
+    return img.astype(np.float32) * scale
+
+
+def read_linear_images_and_times(files: List[str], evs: List[float] = None, times_override: List[float] = None,
+                                 half_size: bool = False) -> Tuple[List[np.ndarray], np.ndarray]:
+    """Wie read_images_and_times_from_list, aber für lineare Eingaben.
+    Ohne EXIF werden die relativen Zeiten aus Helligkeitsverhältnissen bestimmt (bei linearen
+    Daten exakt proportional): je Paar benachbarter Belichtungen auf den in beiden gültigen
+    Pixeln, die Verhältnisse werden dann verkettet. So funktionieren auch weite Reihen,
+    in denen kein Pixel in allen Belichtungen gültig ist.
+    """
+    images = [read_linear_image(path, half_size=half_size) for path in files]
+    shapes = {img.shape for img in images}
+    if len(shapes) != 1:
+        raise RuntimeError('Lineare Eingaben haben unterschiedliche Auflösungen.')
+
+    if times_override is not None:
+        t = np.array(times_override, dtype=np.float32)
+        if len(t) != len(images):
+            raise RuntimeError('Anzahl der --times muss der Anzahl der Bilder entsprechen.')
+        return images, t
+
+    if evs is not None:
+        evs_arr = np.array(evs, dtype=np.float32)
+        if len(evs_arr) != len(images):
+            raise RuntimeError('Anzahl der --ev Werte muss der Anzahl der Bilder entsprechen.')
+        return images, (2.0 ** evs_arr).astype(np.float32)
+
+    exif_times = [_exif_exposure_time(path) for path in files]
+    if all(t is not None for t in exif_times):
+        return images, np.array(exif_times, dtype=np.float32)
+
+    # Reihenfolge nach Gesamthelligkeit (monoton in der Belichtung, auch mit Clipping)
+    peaks = [img.max(axis=2) for img in images]
+    order = np.argsort([float(np.mean(p)) for p in peaks])
+    valid = [(p > LINEAR_NOISE_FLOOR * 10.0) & (p < LINEAR_SATURATION) for p in peaks]
+    times = np.zeros(len(images), dtype=np.float64)
+    times[order[0]] = 1.0
+    for darker, brighter in zip(order[:-1], order[1:]):
+        both = valid[darker] & valid[brighter]
+        if not np.any(both):
+            raise RuntimeError(f'Keine gemeinsamen gültigen Pixel zwischen {files[darker]} und {files[brighter]} '
+                               '– Zeiten bitte über --ev/--times angeben.')
+        ratio = float(np.sum(peaks[brighter][both])) / max(1e-12, float(np.sum(peaks[darker][both])))
+        times[brighter] = times[darker] * ratio
+    return images, (times / times.max()).astype(np.float32)
+
+
+def align_linear_images(images: List[np.ndarray]) -> List[np.ndarray]:
+    """MTB‑Ausrichtung für float‑Bilder: Verschiebung auf 8‑Bit‑Proxies bestimmen, auf die Floats anwenden."""
+    try:
+        mtb = cv2.createAlignMTB()
+        proxies = []
+        for img in images:
+            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+            # Helligkeit angleichen, damit die Median‑Schwelle vergleichbar bleibt
+            gray = gray / max(1e-9, float(np.percentile(gray, 99)))
+            proxies.append((np.clip(gray, 0.0, 1.0) ** (1.0 / 2.2) * 255.0).astype(np.uint8))
+        ref = len(images) // 2
+        aligned = []
+        for img, proxy in zip(images, proxies):
+            shift = mtb.calculateShift(proxies[ref], proxy)
+            aligned.append(mtb.shiftMat(img, shift))
+        return aligned
+    except Exception:
+        return images
+
+
+def merge_linear(images: List[np.ndarray], times: np.ndarray) -> np.ndarray:
+    """Merge linearer Eingaben ohne Kalibrierung: Radiance = Σ w·I/t / Σ w.
+    Gewicht je Pixel aus dem hellsten Kanal (Rampen an Rauschgrenze und Sättigung),
+    multipliziert mit t – längere Belichtungen haben das bessere Signal/Rausch‑Verhältnis.
+    Akkumuliert bildweise; Speicherbedarf unabhängig von der Anzahl der Belichtungen.
+    Pixel ohne gültiges Gewicht fallen auf kürzeste (hell) bzw. längste (dunkel) Belichtung zurück.
+    """
+    if len(images) != len(times):
+        raise RuntimeError('Anzahl der Zeiten muss der Anzahl der Bilder entsprechen.')
+    ramp = 0.05
+    num = np.zeros_like(images[0], dtype=np.float32)
+    den = np.zeros(images[0].shape[:2], dtype=np.float32)
+    for img, t in zip(images, times):
+        t = float(t)
+        peak = img.max(axis=2)
+        w = np.clip((peak - LINEAR_NOISE_FLOOR) / ramp, 0.0, 1.0)
+        w *= np.clip((LINEAR_SATURATION - peak) / ramp, 0.0, 1.0)
+        # w·(I/t) mit w = hat·t  ->  Zähler hat·I, Nenner hat·t
+        num += img * w[:, :, None]
+        den += w * t
+
+    order = np.argsort(times)
+    shortest, longest = order[0], order[-1]
+    hdr = num / np.maximum(den, 1e-12)[:, :, None]
+    empty = den <= 0.0
+    if np.any(empty):
+        bright = images[shortest].max(axis=2) >= 0.5
+        fallback_short = images[shortest] / float(times[shortest])
+        fallback_long = images[longest] / float(times[longest])
+        hdr[empty & bright] = fallback_short[empty & bright]
+        hdr[empty & ~bright] = fallback_long[empty & ~bright]
+    return hdr.astype(np.float32)
+
+
 def align_images(images: List[np.ndarray]) -> List[np.ndarray]:
     """Richtet Belichtungsreihe mit MTB aus (sofern verfügbar)."""
     try:
@@ -285,10 +469,136 @@ def tonemap_ldr(hdr_bgr: np.ndarray, method: str = 'reinhard', gamma: float = 2.
     return ldr8
 
 
+def save_radiance(path: str, hdr_bgr: np.ndarray):
+    """Speichert je nach Endung als .hdr oder .exr."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.hdr':
+        save_hdr(path, hdr_bgr)
+    elif ext == '.exr':
+        save_exr(path, hdr_bgr)
+    else:
+        raise RuntimeError('Unbekanntes Ausgabeformat. Verwende .hdr oder .exr')
+
+
+# Reelle SH‑Basis bis Band 2 (Ramamoorthi & Hanrahan), Reihenfolge l,m: 00, 1-1, 10, 11, 2-2, 2-1, 20, 21, 22
+SH_BAND_FACTORS = np.array([np.pi] + [2.0 * np.pi / 3.0] * 3 + [np.pi / 4.0] * 5, dtype=np.float32)
+
+
+def _sh_basis(x: np.ndarray, y: np.ndarray, z: np.ndarray) -> np.ndarray:
+    """9 SH‑Basisfunktionen für Richtungsvektoren; Ergebnis (9, ...)."""
+    return np.stack([
+        np.full_like(x, 0.282095),
+        0.488603 * y,
+        0.488603 * z,
+        0.488603 * x,
+        1.092548 * x * y,
+        1.092548 * y * z,
+        0.315392 * (3.0 * z * z - 1.0),
+        1.092548 * x * z,
+        0.546274 * (x * x - y * y),
+    ]).astype(np.float32)
+
+
+def _latlong_directions(width: int, height: int, rows: slice = slice(None)):
+    """Richtungen der Pixelzentren einer Lat‑Long‑Map (z oben, Zeile 0 = Zenit, Spalte 0 = +x, Spalte W/4 = -y, Mitte = -x)
+    für die Zeilen rows (Standard: alle), plus Raumwinkel je Zeile (sinθ·Δθ·Δφ) als (n,1).
+    x, y, z haben die Form (n, W); streifenweise aufgerufen bleibt der Speicherbedarf begrenzt.
+    """
+    theta = (np.arange(height, dtype=np.float32)[rows] + 0.5) * (np.pi / height)
+    phi = (np.arange(width, dtype=np.float32) + 0.5) * (2.0 * np.pi / width) - np.pi
+    st = np.sin(theta)[:, None]
+    x = -st * np.cos(phi)[None, :]
+    y = st * np.sin(phi)[None, :]
+    z = np.broadcast_to(np.cos(theta)[:, None], x.shape)
+    solid_angle = st * (np.pi / height) * (2.0 * np.pi / width)
+    return x, y, z, solid_angle
+
+
+def compute_lighting(hdr_bgr: np.ndarray, mip_levels: int = 6, sh_max_width: int = 1024,
+                     irradiance_size: Tuple[int, int] = (128, 64), strip_rows: int = 64, on_mip=None):
+    """Vorgefilterte Beleuchtung aus einer äquirektangulären (2:1) HDR‑Map.
+    - Mips: fortlaufende Flächen‑Halbierung (erhält das Integral über die Kugel). Jede Stufe geht
+      sofort an on_mip(level, img) und wird nicht aufgehoben – neben der Eingabe liegt immer nur
+      die aktuelle Stufe (plus die SH‑Quelle) im Speicher
+    - SH (Band 0–2): raumwinkelgewichtete Projektion auf der kleinsten Stufe mit Breite <= sh_max_width,
+      zeilenweise in Streifen, damit der Speicherbedarf begrenzt bleibt
+    - Irradiance‑Map: aus den SH‑Koeffizienten ausgewertet (Lambert‑Faltung)
+    Liefert (irradiance_bgr, sh_rgb) mit sh_rgb als (9, 3) Array.
+    """
+    def halve(img: np.ndarray) -> np.ndarray:
+        return cv2.resize(img, (img.shape[1] // 2, img.shape[0] // 2), interpolation=cv2.INTER_AREA)
+
+    level = hdr_bgr.astype(np.float32, copy=False)
+    sh_source = level if level.shape[1] <= sh_max_width else None
+    for i in range(1, max(0, mip_levels) + 1):
+        if level.shape[1] < 4 or level.shape[0] < 2:
+            break
+        level = halve(level)
+        if on_mip is not None:
+            on_mip(i, level)
+        if sh_source is None and level.shape[1] <= sh_max_width:
+            sh_source = level
+    if sh_source is None:
+        sh_source = level
+        while sh_source.shape[1] > sh_max_width:
+            sh_source = halve(sh_source)
+    del level
+
+    h, w = sh_source.shape[:2]
+    sh = np.zeros((9, 3), dtype=np.float64)
+    for r0 in range(0, h, strip_rows):
+        rows = slice(r0, min(h, r0 + strip_rows))
+        x, y, z, solid_angle = _latlong_directions(w, h, rows)
+        basis = _sh_basis(x, y, z)                                       # (9, rows, W)
+        weighted = sh_source[rows, :, ::-1] * solid_angle[:, :, None]    # RGB · dω
+        sh += np.einsum('krw,rwc->kc', basis, weighted, optimize=True)
+
+    iw, ih = irradiance_size
+    x, y, z, _ = _latlong_directions(iw, ih)
+    basis = _sh_basis(x, y, z)
+    irr_rgb = np.einsum('khw,kc->hwc', basis, (sh * SH_BAND_FACTORS[:, None]).astype(np.float32))
+    irradiance_bgr = np.maximum(irr_rgb[:, :, ::-1], 0.0).astype(np.float32)
+    return irradiance_bgr, sh.astype(np.float32)
+
+
+def write_lighting(output_path: str, hdr_bgr: np.ndarray, mip_levels: int = 6) -> str:
+    """Schreibt Mips, Irradiance‑Map und SH‑JSON neben die HDR‑Ausgabe; liefert den JSON‑Pfad.
+    Mips werden geschrieben, sobald sie berechnet sind.
+    """
+    h, w = hdr_bgr.shape[:2]
+    if w != 2 * h:
+        print(f'[WARN] Keine 2:1 Lat‑Long‑Map ({w}x{h}) – Beleuchtung wird trotzdem berechnet.')
+    stem, ext = os.path.splitext(output_path)
+
+    mip_files = []
+
+    def save_mip(level: int, mip: np.ndarray):
+        path = f'{stem}_mip{level}{ext}'
+        save_radiance(path, mip)
+        mip_files.append({'level': level, 'file': os.path.basename(path), 'width': mip.shape[1], 'height': mip.shape[0]})
+
+    irradiance, sh = compute_lighting(hdr_bgr, mip_levels=mip_levels, on_mip=save_mip)
+    irr_path = f'{stem}_irradiance{ext}'
+    save_radiance(irr_path, irradiance)
+
+    info = {
+        'source': os.path.basename(output_path),
+        'convention': 'latlong, z-up, row 0 = zenith, column 0 = +x, column W/4 = -y, centre column = -x, linear RGB',
+        'sh': {'bands': 3, 'order': ['00', '1-1', '10', '11', '2-2', '2-1', '20', '21', '22'],
+               'rgb': [[round(float(c), 6) for c in row] for row in sh]},
+        'irradiance': {'file': os.path.basename(irr_path), 'width': irradiance.shape[1], 'height': irradiance.shape[0]},
+        'mips': mip_files,
+    }
+    json_path = f'{stem}_lighting.json'
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(info, f, indent=2)
+    return json_path
+
+
 def main():
     ap = argparse.ArgumentParser(description='Merge multiple JPGs into HDR/EXR radiance map.')
-    ap.add_argument('--input', help='Eingabeverzeichnis mit Belichtungsreihen (JPG/PNG)')
-    ap.add_argument('--files', nargs='+', help='Explizite Datei‑Liste (JPG/PNG)')
+    ap.add_argument('--input', help='Eingabeverzeichnis mit Belichtungsreihen (JPG/PNG, DNG/TIFF)')
+    ap.add_argument('--files', nargs='+', help='Explizite Datei‑Liste (JPG/PNG, DNG/TIFF)')
     ap.add_argument('--output', required=True, help='Ausgabedatei (.hdr oder .exr)')
     ap.add_argument('--method', choices=['debevec', 'robertson'], default='debevec', help='Kalibrierung/Merge Methode')
     ap.add_argument('--ev', nargs='+', type=float, help='EV‑Stufen je Bild, z. B. -2 -1 0 1 2')
@@ -297,11 +607,34 @@ def main():
     ap.add_argument('--tonemap', choices=['reinhard', 'drago', 'mantiuk'], help='Tonemapping für LDR‑Preview')
     ap.add_argument('--ldr-output', help='Pfad für LDR‑Preview (PNG/JPG)')
     ap.add_argument('--gamma', type=float, default=2.2, help='Gamma für LDR‑Preview')
+    ap.add_argument('--half-size', action='store_true', help='Halbe Auflösung für lineare Eingaben (DNG: reduzierte Dekodierung, TIFF/PNG: jedes zweite Pixel)')
+    ap.add_argument('--lighting', action='store_true', help='Lat‑Long‑Mips, Irradiance‑Map und SH‑Koeffizienten neben die Ausgabe schreiben')
+    ap.add_argument('--lighting-mips', type=int, default=6, help='Anzahl Mip‑Stufen für --lighting')
     args = ap.parse_args()
 
     try:
-        # Eingaben laden
+        # Lineare Eingaben (DNG, 16‑Bit TIFF/PNG) erkennen
+        linear_files = None
         if args.files:
+            flags = [is_linear_input(f) for f in args.files]
+            if any(flags):
+                if not all(flags):
+                    raise RuntimeError('Lineare (DNG/TIFF/16‑Bit) und 8‑Bit Eingaben nicht mischen.')
+                linear_files = args.files
+        elif args.input:
+            candidates = sorted(os.path.join(args.input, f) for f in os.listdir(args.input)
+                                if f.lower().endswith(LINEAR_EXTENSIONS + ('.png',)))
+            linear_files = [f for f in candidates if is_linear_input(f)] or None
+
+        # Eingaben laden
+        if linear_files:
+            images, times = read_linear_images_and_times(
+                linear_files,
+                evs=args.ev,
+                times_override=args.times,
+                half_size=args.half_size
+            )
+        elif args.files:
             images, times = read_images_and_times_from_list(
                 args.files,
                 evs=args.ev,
@@ -327,22 +660,25 @@ def main():
 
         # Optional ausrichten
         if args.align:
-            images = align_images(images)
+            images = align_linear_images(images) if linear_files else align_images(images)
             print('[INFO] Alignment (MTB) angewendet.')
 
         # Merge
-        hdr = merge_hdr(images, times, method=args.method)
+        if linear_files:
+            hdr = merge_linear(images, times)
+            print('[INFO] Lineare Eingaben: Merge ohne Response‑Kalibrierung.')
+        else:
+            hdr = merge_hdr(images, times, method=args.method)
 
         # Output HDR/EXR
-        ext = os.path.splitext(args.output)[1].lower()
-        if ext == '.hdr':
-            save_hdr(args.output, hdr)
-        elif ext == '.exr':
-            save_exr(args.output, hdr)
-        else:
-            raise RuntimeError('Unbekanntes Ausgabeformat. Verwende .hdr oder .exr')
+        save_radiance(args.output, hdr)
         print(f'[OK] HDR/EXR gespeichert: {args.output}')
 
+        # Optional vorgefilterte Beleuchtung (Mips, Irradiance, SH)
+        if args.lighting:
+            json_path = write_lighting(args.output, hdr, mip_levels=args.lighting_mips)
+            print(f'[OK] Beleuchtung gespeichert: {json_path}')
+
         # Optional LDR Preview
         if args.ldr_output:
             tm_method = args.tonemap or 'reinhard'
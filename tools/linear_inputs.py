@@ -0,0 +1,97 @@
+"""
+Erkennung linearer Eingaben (DNG, 16‑Bit TIFF/PNG) und EXIF‑Belichtungszeiten.
+
+Gemeinsam genutzt von tools/hdr_merge.py und der Bridge (bridge/insta360-python/app.py),
+damit Upload und Merge dieselbe Regel anwenden. Bewusst ohne opencv/numpy/pillow –
+nur Header werden gelesen, nichts wird dekodiert.
+"""
+
+import os
+import struct
+from typing import Optional
+
+RAW_EXTENSIONS = ('.dng',)
+TIFF_EXTENSIONS = ('.tif', '.tiff')
+LINEAR_EXTENSIONS = RAW_EXTENSIONS + TIFF_EXTENSIONS
+
+
+def tiff_bits_per_sample(path: str) -> int:
+    """BitsPerSample (Tag 258) aus dem ersten IFD lesen, ohne zu dekodieren (TIFF und BigTIFF).
+    Fehlt der Tag, gilt der TIFF‑Standard 1; 0 bei unlesbarem Header.
+    """
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+            if head[:2] == b'II':
+                e = '<'
+            elif head[:2] == b'MM':
+                e = '>'
+            else:
+                return 0
+            magic = struct.unpack(e + 'H', head[2:4])[0]
+            if magic == 42:
+                f.seek(struct.unpack(e + 'I', head[4:8])[0])
+                count = struct.unpack(e + 'H', f.read(2))[0]
+                entry_fmt, ptr_fmt = e + 'HHI4s', e + 'I'
+            elif magic == 43:
+                f.seek(struct.unpack(e + 'Q', head[8:16])[0])
+                count = struct.unpack(e + 'Q', f.read(8))[0]
+                entry_fmt, ptr_fmt = e + 'HHQ8s', e + 'Q'
+            else:
+                return 0
+            entry_size = struct.calcsize(entry_fmt)
+            for _ in range(min(count, 4096)):
+                tag, typ, n, value = struct.unpack(entry_fmt, f.read(entry_size))
+                if tag != 258:
+                    continue
+                if typ != 3:  # SHORT
+                    return 0
+                if n * 2 > len(value):
+                    f.seek(struct.unpack(ptr_fmt, value)[0])
+                    value = f.read(2)
+                return struct.unpack(e + 'H', value[:2])[0]
+            return 1
+    except (OSError, struct.error):
+        return 0
+
+
+def is_linear_input(path: str) -> bool:
+    """True für DNG sowie TIFF/PNG ab 16 Bit (Bit‑Tiefe aus dem Header, ohne Dekodieren).
+    8‑Bit TIFF/PNG gelten als gamma‑kodiert und laufen über den kalibrierten Pfad.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext in RAW_EXTENSIONS:
+        return True
+    if ext in TIFF_EXTENSIONS:
+        return tiff_bits_per_sample(path) >= 16
+    if ext == '.png':
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(25)
+            # PNG-Signatur (8) + Chunk-Länge (4) + 'IHDR' (4) + Breite/Höhe (8) -> Bit-Tiefe
+            return len(head) == 25 and head[12:16] == b'IHDR' and head[24] == 16
+        except OSError:
+            return False
+    return False
+
+
+def exif_exposure_time(exif) -> Optional[float]:
+    """Belichtungszeit (Sekunden) aus einem EXIF‑Mapping (z. B. PIL getexif()) oder None.
+    ExposureTime (33434), sonst ShutterSpeedValue (37377, APEX).
+    """
+    try:
+        et = exif.get(33434)
+        if et:
+            if isinstance(et, tuple) and len(et) == 2 and et[1] != 0:
+                return float(et[0]) / float(et[1])
+            return float(et)
+        ssv = exif.get(37377)
+        if ssv:
+            if isinstance(ssv, tuple) and len(ssv) == 2 and ssv[1] != 0:
+                apex = float(ssv[0]) / float(ssv[1])
+            else:
+                apex = float(ssv)
+            return float(2.0 ** (-apex))
+    except Exception:
+        pass
+    return None
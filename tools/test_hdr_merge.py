@@ -0,0 +1,65 @@
+"""
+Tests für tools/hdr_merge.py (Beleuchtungs‑Konvention der Lat‑Long‑Maps).
+
+  python -m pytest tools/test_hdr_merge.py
+  python tools/test_hdr_merge.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import hdr_merge  # noqa: E402
+
+SH_ORDER = ['00', '1-1', '10', '11', '2-2', '2-1', '20', '21', '22']
+
+
+def _latlong_with_light(column: int, width: int = 256) -> np.ndarray:
+    """Schwarze 2:1 Map mit einer hellen Quelle auf dem Äquator in der gegebenen Spalte."""
+    height = width // 2
+    img = np.zeros((height, width, 3), dtype=np.float32)
+    img[height // 2 - 2:height // 2 + 2, column - 2:column + 2] = 1000.0
+    return img
+
+
+def test_light_at_column_zero_is_plus_x():
+    _, sh = hdr_merge.compute_lighting(_latlong_with_light(2), mip_levels=0)
+    l1m1, l11 = sh[SH_ORDER.index('1-1'), 0], sh[SH_ORDER.index('11'), 0]
+    assert l11 > 0.0
+    assert abs(l1m1) < 0.05 * l11
+
+
+def test_light_at_centre_is_minus_x():
+    _, sh = hdr_merge.compute_lighting(_latlong_with_light(128), mip_levels=0)
+    l1m1, l11 = sh[SH_ORDER.index('1-1'), 0], sh[SH_ORDER.index('11'), 0]
+    assert l11 < 0.0
+    assert abs(l1m1) < 0.05 * abs(l11)
+
+
+def test_light_at_quarter_column_is_minus_y():
+    _, sh = hdr_merge.compute_lighting(_latlong_with_light(64), mip_levels=0)
+    l1m1, l11 = sh[SH_ORDER.index('1-1'), 0], sh[SH_ORDER.index('11'), 0]
+    assert l1m1 < 0.0
+    assert abs(l11) < 0.05 * abs(l1m1)
+
+
+def test_published_convention_matches_sh():
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, 'env.hdr')
+        json_path = hdr_merge.write_lighting(out, _latlong_with_light(2), mip_levels=1)
+        with open(json_path, 'r', encoding='utf-8') as f:
+            info = json.load(f)
+    assert 'column 0 = +x' in info['convention']
+    assert info['sh']['order'] == SH_ORDER
+    assert info['sh']['rgb'][SH_ORDER.index('11')][0] > 0.0
+
+
+if __name__ == '__main__':
+    for name, fn in sorted(globals().items()):
+        if name.startswith('test_') and callable(fn):
+            fn()
+            print(f'[OK] {name}')